@@ -1,65 +1,349 @@
+import contextlib
+import hashlib
+import os
+import re
+import tempfile
+import threading
 import warnings
+import weakref
 warnings.filterwarnings("ignore")
-from sentence_transformers import SentenceTransformer, util
-import torch
+import numpy as np
+
+try:
+    # Optional: faster best-match search for very long policies (pip install faiss-cpu)
+    import faiss
+except ImportError:
+    faiss = None
+
+# The CPU process pool is for offline batch runs: audit_policies() batches with more
+# text than this (characters, summed over all chunks) are sharded across it. Single
+# policies (encode_policy/audit_policy, and so the app) always encode in-process.
+# Not benchmarked; set so that a batch of one or two policies the size of the bundled
+# sample (~34k chars each) stays in-process.
+MULTI_PROCESS_MIN_CHARS = 100_000
+
+# Audits comparing more rule x chunk pairs than this are searched with a FAISS
+# inner-product index (if installed), so both larger rule sets and longer policies
+# qualify; smaller ones stay on a numpy matmul, which is cheaper than building an index.
+FAISS_MIN_PAIRS = 100_000
+
+# One rule per line, split at the first colon: "Rule ID: Rule Text"
+_RULE_RE = re.compile(r'^([^:\n]*):(.*)$', re.MULTILINE)
+
+# A policy sentence: runs up to '.', '!' or '?' followed by whitespace, or to the end
+# of the line. Dots inside tokens (e.g. "3.5", "www.example.com") don't split.
+_SENT_RE = re.compile(r'\S(?:[^.!?\n]|[.!?](?=\S))*[.!?]*', re.MULTILINE)
+
+# Dynamically quantized (int8, AVX512-VNNI) ONNX export, as written by
+# export_dynamic_quantized_onnx_model and used by quantized=True
+QUANTIZED_ONNX_FILE = 'onnx/model_qint8_avx512_vnni.onnx'
+
+# Intra-op threads for CPU inference. Small encode batches stop scaling past a few
+# cores and extra threads only add synchronisation overhead.
+ENCODER_THREADS = min(4, os.cpu_count() or 1)
+
+# Token cap per chunk: MiniLM's window. Models with a shorter window keep their own.
+MAX_SEQ_LENGTH = 256
+
+# Characters kept per chunk before tokenizing. Comfortably more than MAX_SEQ_LENGTH
+# tokens of English, so the model sees the same window while the tokenizer skips
+# text it would throw away anyway.
+MAX_CHUNK_CHARS = 1500
+
+# Rule embeddings are saved here, keyed by model and rule text, to skip encoding on startup
+RULE_CACHE_DIR = 'cache'
+
+# Local copies of models exported to int8 ONNX, one sub-folder per model
+QUANTIZED_MODEL_DIR = os.path.join('cache', 'onnx-int8')
 
 class ComplianceAuditor:
-    def __init__(self, model_name='all-MiniLM-L6-v2'):
-        # Load the model only once
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name='all-MiniLM-L6-v2', quantized=False, cpu_bf16=False,
+                 compile_model=False):
+        """
+        Args:
+            model_name (str): Sentence-transformers model used for rules and policies.
+            quantized (bool): Run the int8 ONNX Runtime export instead of the FP32
+                PyTorch model. Needs `pip install sentence-transformers[onnx]`.
+            cpu_bf16 (bool): Run CPU inference under bfloat16 autocast. Only worth it
+                on CPUs with native BF16 support (AVX512-BF16 / AMX).
+            compile_model (bool): torch.compile the PyTorch model and warm it up during
+                construction. Needs a working C++ toolchain for the Inductor backend.
+        """
+        self.model_name = model_name
+        self.quantized = quantized
+        self.cpu_bf16 = cpu_bf16
+        self.compile_model = compile_model and not quantized
+        # Loaded on first use; a warm rule cache means startup never touches the model
+        self._model = None
+        # The app shares one auditor between sessions, so first use can be concurrent
+        self._lock = threading.Lock()
         self.rules = self._load_rules()
+        # Multi-process encoding pool, started on the first large audit_policies() batch
+        self.pool = None
         
         # Pre-compute embeddings for speed
         if self.rules:
             self.rule_texts = [r['text'] for r in self.rules]
-            self.rule_embeddings = self.model.encode(self.rule_texts, convert_to_tensor=True)
+            self.rule_embeddings = self._load_rule_embeddings()
         else:
             self.rule_embeddings = None
 
+        # Pay compilation here, inside the app's cached load_auditor(), not in the first audit.
+        # No-op when a cold rule cache already loaded (and compiled) it to encode the rules.
+        if self.compile_model:
+            self._load_model()
+
+    @property
+    def model(self):
+        """The sentence-transformers model, loaded only once on first access."""
+        return self._load_model()
+
+    def _load_model(self):
+        """Returns the model, building it first if no thread has done so yet."""
+        if self._model is None:
+            with self._lock:
+                # Re-check: another session may have finished loading while we waited
+                if self._model is None:
+                    self._model = self._build_model()
+        return self._model
+
+    def _build_model(self):
+        """Loads the model for the configured backend, compiling it if requested."""
+        # Imported here so a warm rule cache never pays the torch/transformers import
+        from sentence_transformers import SentenceTransformer
+        import torch
+        torch.set_num_threads(ENCODER_THREADS)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Only settable before torch has run any inter-op parallel work
+            pass
+        if self.quantized:
+            model = SentenceTransformer(
+                self._export_quantized_model(), backend='onnx',
+                model_kwargs={'file_name': QUANTIZED_ONNX_FILE}
+            )
+        else:
+            # Weights stay FP32; _encode() runs policy chunks under FP16/BF16 autocast
+            model = SentenceTransformer(self.model_name)
+        # Only ever lowered, so no model runs past the length it was trained on
+        model.max_seq_length = min(model.max_seq_length or MAX_SEQ_LENGTH, MAX_SEQ_LENGTH)
+        if self.compile_model:
+            # Compiled before it is published, so other sessions never run it half-built
+            self._compile_model(model, torch)
+        return model
+
+    def _compile_model(self, model, torch):
+        """Swaps in a torch.compile'd transformer, staying eager if compilation fails."""
+        transformer = model[0]
+        # sentence-transformers 6 stores the Hugging Face model as `model` and makes
+        # `auto_model` a read-only alias for it; 5.x stores it as `auto_model`
+        attr = 'model' if 'model' in transformer._modules else 'auto_model'
+        eager_model = getattr(transformer, attr)
+        # dynamic=True: batch size and padded length vary with every policy
+        setattr(transformer, attr, torch.compile(eager_model, mode='reduce-overhead', dynamic=True))
+        try:
+            # Compilation happens on the first forward pass, so trigger it now through
+            # _encode(), the path audits take: Dynamo guards on inference mode and
+            # autocast state, and specializes batches of one, so warm up with two
+            # sentences under the same settings or the first audit compiles again
+            self._encode(
+                ['Warm-up sentence.', 'A second, longer sentence to warm up batching.'],
+                model=model, normalize_embeddings=True, show_progress_bar=False
+            )
+        except RuntimeError:
+            # Dynamo/Inductor errors, e.g. no usable compiler toolchain on this machine
+            setattr(transformer, attr, eager_model)
+            self.compile_model = False
+
+    def _export_quantized_model(self):
+        """Exports the model to int8 ONNX once and returns the local model folder."""
+        model_dir = os.path.join(QUANTIZED_MODEL_DIR, self.model_name.replace('/', '--'))
+        if not os.path.exists(os.path.join(model_dir, QUANTIZED_ONNX_FILE)):
+            from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+            # backend='onnx' converts the PyTorch weights to FP32 ONNX on load
+            onnx_model = SentenceTransformer(self.model_name, backend='onnx')
+            onnx_model.save(model_dir)
+            export_dynamic_quantized_onnx_model(onnx_model, 'avx512_vnni', model_dir)
+        return model_dir
+
+    def _encode(self, sentences, full_precision=False, model=None, **kwargs):
+        """
+        Runs model.encode() in the configured precision and returns an FP32 numpy array.
+        full_precision=True skips autocast, for embeddings that are cached on disk.
+        model defaults to self.model; passed explicitly to warm up one still being built.
+        """
+        import torch  # deferred along with sentence_transformers
+        if model is None:
+            model = self.model
+        device = model.device.type
+        if full_precision or self.quantized:
+            precision = contextlib.nullcontext()
+        elif device == 'cuda':
+            # FP16 matmuls run on the tensor cores and halve activation traffic
+            precision = torch.autocast('cuda', dtype=torch.float16)
+        elif self.cpu_bf16 and device == 'cpu':
+            precision = torch.autocast('cpu', dtype=torch.bfloat16)
+        else:
+            precision = contextlib.nullcontext()
+        with torch.inference_mode(), precision:
+            embeddings = model.encode(sentences, convert_to_tensor=True, **kwargs)
+        # Scores are always compared in FP32 so matches near the threshold stay stable
+        result = embeddings.float().cpu().numpy()
+        del embeddings
+        if device == 'cuda':
+            # Return cached activation blocks so a long-running session doesn't pin GPU memory
+            torch.cuda.empty_cache()
+        return result
+
+    def rule_cache_path(self):
+        """Path of the rule embedding cache for this model, backend and rule set."""
+        # 'fp32' also retires caches written before rules were always encoded in FP32
+        key = '\n'.join([self.model_name, str(self.quantized), 'fp32'] + self.rule_texts)
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(RULE_CACHE_DIR, f'rules_{digest}.npy')
+
+    def _load_rule_embeddings(self):
+        """Memory-maps the normalized rule embeddings from disk, encoding and saving them on a miss."""
+        path = self.rule_cache_path()
+        if os.path.exists(path):
+            try:
+                # Read-only mmap: no copy into the process, and the OS shares the pages
+                # between every worker that opens the same file
+                return np.load(path, mmap_mode='r')
+            except (ValueError, OSError):
+                # Unreadable or truncated file: re-encode below, which replaces it
+                pass
+
+        # Cached rules are shared by every precision setting, so encode them in FP32
+        emb = self._encode(self.rule_texts, full_precision=True, normalize_embeddings=True)
+        try:
+            os.makedirs(RULE_CACHE_DIR, exist_ok=True)
+            # Write to a temp file and rename it into place, so a crash or a second
+            # process starting at the same time never leaves a partial cache behind
+            fd, tmp_path = tempfile.mkstemp(dir=RULE_CACHE_DIR, suffix='.npy.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, emb)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        except OSError:
+            # Read-only deployments just re-encode on every start
+            pass
+        return emb
+
     def _load_rules(self, filename='dpdp_rules.txt'):
         """Parses the rule file (Format: Rule ID: Rule Text)"""
-        parsed_rules = []
         try:
             with open(filename, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if ':' in line:
-                        rule_id, rule_text = line.split(':', 1)
-                        parsed_rules.append({
-                            'id': rule_id.strip(),
-                            'text': rule_text.strip()
-                        })
-            return parsed_rules
+                content = f.read()
         except FileNotFoundError:
             return []
+        return [
+            {'id': rule_id.strip(), 'text': rule_text.strip()}
+            for rule_id, rule_text in _RULE_RE.findall(content)
+        ]
 
-    def audit_policy(self, policy_text, threshold=0.50):
+    def encode_policy(self, policy_text, batch_size=128):
         """
-        Audits the policy text against loaded rules.
+        Splits the policy into sentences and embeds them.
         Args:
             policy_text (str): The full text of the privacy policy.
-            threshold (float): Score cutoff for 'PASS' (0.0 to 1.0).
+            batch_size (int): Chunks per encoder forward pass.
+        Returns:
+            tuple: (policy_chunks, policy_embeddings), or ([], None) if no usable sentences.
         """
-        if not policy_text or not self.rules:
-            return []
-        
-        # Split policy into meaningful chunks (paragraphs)
-        policy_chunks = [p.strip() for p in policy_text.split('\n') if len(p) > 20]
+        policy_chunks = self._split_policy(policy_text)
         
         if not policy_chunks:
+            return [], None
+
+        return policy_chunks, self._encode_chunks(policy_chunks, batch_size)
+
+    def _split_policy(self, policy_text):
+        """Splits policy text into the unique sentences worth matching."""
+        # Split policy into meaningful chunks (sentences), so one-line policies and long
+        # paragraphs still give focused units to match. Repeated boilerplate (headers,
+        # footers, "Contact us" blocks) is encoded once; dict keeps first-seen order.
+        sentences = (s.strip() for s in _SENT_RE.findall(policy_text))
+        return list(dict.fromkeys(s for s in sentences if len(s) > 20))
+
+    def _encode_chunks(self, policy_chunks, batch_size, use_pool=False):
+        """Embeds policy chunks; with use_pool, large inputs are sharded across the CPU process pool."""
+        # Only the encoder input is clipped; results still quote the full chunk
+        policy_chunks = [chunk[:MAX_CHUNK_CHARS] for chunk in policy_chunks]
+
+        # encode() sorts the chunks by length before batching (and restores the input
+        # order afterwards), so each batch pads to similar lengths.
+        # ONNX sessions can't be pickled to the workers, and compiled models stay
+        # in-process because pool workers would each recompile from scratch
+        if (use_pool and sum(map(len, policy_chunks)) > MULTI_PROCESS_MIN_CHARS
+                and (os.cpu_count() or 1) > 1
+                and self.model.device.type == 'cpu'
+                and not self.quantized and not self.compile_model):
+            # The pool shards the input in order and each worker only sorts its own shard,
+            # so sort globally first to keep similar lengths together, then undo the sort
+            order = np.argsort([-len(chunk) for chunk in policy_chunks], kind='stable')
+            embeddings = self.model.encode_multi_process(
+                [policy_chunks[i] for i in order], self._get_pool(),
+                batch_size=batch_size, normalize_embeddings=True
+            )
+            return embeddings[np.argsort(order)].astype(np.float32)
+        return self._encode(
+            policy_chunks, batch_size=batch_size,
+            normalize_embeddings=True, show_progress_bar=False
+        )
+
+    def _get_pool(self):
+        """Starts one single-threaded CPU encoding worker per core on first use."""
+        if self.pool is None:
+            # Fetched first: loading the model takes the same (non-reentrant) lock
+            model = self.model
+            # Held while starting, so concurrent large audits share one pool, and no other
+            # auditor thread starts work while OMP_NUM_THREADS is overridden
+            with self._lock:
+                if self.pool is None:
+                    # Workers read OMP_NUM_THREADS when they import torch. Without this each
+                    # of the N workers would start N threads of its own and fight over the cores.
+                    previous = os.environ.get('OMP_NUM_THREADS')
+                    os.environ['OMP_NUM_THREADS'] = '1'
+                    try:
+                        pool = model.start_multi_process_pool(['cpu'] * os.cpu_count())
+                    finally:
+                        if previous is None:
+                            del os.environ['OMP_NUM_THREADS']
+                        else:
+                            os.environ['OMP_NUM_THREADS'] = previous
+                    # Also stop the workers once the auditor is garbage-collected or at
+                    # interpreter exit, for callers that never call close()
+                    self._pool_finalizer = weakref.finalize(
+                        self, model.stop_multi_process_pool, pool
+                    )
+                    self.pool = pool
+        return self.pool
+
+    def close(self):
+        """Stops the encoding worker processes, if any were started."""
+        with self._lock:
+            if self.pool is not None:
+                self._pool_finalizer()
+                self.pool = None
+
+    def score_policy(self, policy_chunks, policy_embeddings, threshold=0.50):
+        """
+        Scores pre-computed policy embeddings against the loaded rules.
+        No model call happens here, so re-running with a new threshold is cheap.
+        """
+        if not policy_chunks or not self.rules:
             return []
 
-        # Vectorize the policy text
-        policy_embeddings = self.model.encode(policy_chunks, convert_to_tensor=True)
-        
+        best_scores, best_idx = self._best_matches(policy_embeddings)
+
         audit_results = []
 
-        for i, rule in enumerate(self.rules):
-            # Find the single best matching paragraph for this rule
-            scores = util.cos_sim(self.rule_embeddings[i], policy_embeddings)[0]
-            best_match_idx = scores.argmax().item()
-            score = scores[best_match_idx].item()
-            matched_text = policy_chunks[best_match_idx]
-            
+        for rule, score, best_match_idx in zip(self.rules, best_scores, best_idx):
             # Compliance Decision
             is_compliant = score > threshold 
             
@@ -68,7 +352,70 @@ class ComplianceAuditor:
                 'requirement': rule['text'],
                 'match_score': round(score * 100, 1),
                 'status': 'PASS' if is_compliant else 'FAIL',
-                'company_clause': matched_text if is_compliant else "No matching clause found."
+                # Gaps never show the matched text, so only look it up for passes
+                'company_clause': policy_chunks[best_match_idx] if is_compliant else "No matching clause found."
             })
             
         return audit_results
+
+    def _best_matches(self, policy_embeddings):
+        """Returns the best score and matching chunk index for every rule, as Python lists."""
+        # Embeddings are unit-length, so inner product is the cosine score
+        if (faiss is not None
+                and len(self.rule_embeddings) * len(policy_embeddings) > FAISS_MIN_PAIRS):
+            index = faiss.IndexFlatIP(policy_embeddings.shape[1])
+            index.add(policy_embeddings)
+            scores, idx = index.search(self.rule_embeddings, 1)
+            return scores[:, 0].tolist(), idx[:, 0].tolist()
+
+        # One BLAS GEMM for all pairs: [rules, chunks]. Plain numpy keeps torch's
+        # dispatcher out of this step, which matters at these small sizes.
+        sim = self.rule_embeddings @ policy_embeddings.T
+        best_idx = sim.argmax(axis=1)
+        best_scores = sim[np.arange(len(sim)), best_idx]
+        return best_scores.tolist(), best_idx.tolist()
+
+    def audit_policy(self, policy_text, threshold=0.50, batch_size=128):
+        """
+        Audits the policy text against loaded rules.
+        Args:
+            policy_text (str): The full text of the privacy policy.
+            threshold (float): Score cutoff for 'PASS' (0.0 to 1.0).
+            batch_size (int): Chunks per encoder forward pass.
+        """
+        if not policy_text or not self.rules:
+            return []
+
+        policy_chunks, policy_embeddings = self.encode_policy(policy_text, batch_size=batch_size)
+        return self.score_policy(policy_chunks, policy_embeddings, threshold=threshold)
+
+    def audit_policies(self, policies, threshold=0.50, batch_size=128):
+        """
+        Audits several policies, encoding all of their chunks in one pass.
+        Args:
+            policies (list[str]): Full texts of the privacy policies.
+            threshold (float): Score cutoff for 'PASS' (0.0 to 1.0).
+            batch_size (int): Chunks per encoder forward pass.
+        Returns:
+            list: One audit_policy() result list per policy, in input order.
+        """
+        if not self.rules:
+            return [[] for _ in policies]
+
+        chunk_lists = [self._split_policy(text) if text else [] for text in policies]
+        all_chunks = [chunk for chunks in chunk_lists for chunk in chunks]
+        if not all_chunks:
+            return [[] for _ in policies]
+
+        # One mega-batch keeps the encoder busy instead of paying setup per policy
+        all_embeddings = self._encode_chunks(all_chunks, batch_size, use_pool=True)
+
+        audit_results = []
+        start = 0
+        for policy_chunks in chunk_lists:
+            end = start + len(policy_chunks)
+            audit_results.append(
+                self.score_policy(policy_chunks, all_embeddings[start:end], threshold=threshold)
+            )
+            start = end
+        return audit_results
@@ -1,67 +1,14 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
+import csv
+import io
 import warnings
 warnings.filterwarnings("ignore")
-from sentence_transformers import SentenceTransformer, util
 
 # ==========================================
 # 🧠 PART 1: THE AI ENGINE (Backend Logic)
 # ==========================================
-class ComplianceAuditor:
-    def __init__(self, model_name='all-MiniLM-L6-v2'):
-        self.model = SentenceTransformer(model_name)
-        self.rules = self._load_rules()
-        
-        if self.rules:
-            self.rule_texts = [r['text'] for r in self.rules]
-            self.rule_embeddings = self.model.encode(self.rule_texts, convert_to_tensor=True)
-        else:
-            self.rule_embeddings = None
-
-    def _load_rules(self, filename='dpdp_rules.txt'):
-        parsed_rules = []
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if ':' in line:
-                        rule_id, rule_text = line.split(':', 1)
-                        parsed_rules.append({
-                            'id': rule_id.strip(),
-                            'text': rule_text.strip()
-                        })
-            return parsed_rules
-        except FileNotFoundError:
-            return []
-
-    def audit_policy(self, policy_text, threshold=0.50):
-        if not policy_text or not self.rules:
-            return []
-        
-        policy_chunks = [p.strip() for p in policy_text.split('\n') if len(p) > 20]
-        if not policy_chunks:
-            return []
-
-        policy_embeddings = self.model.encode(policy_chunks, convert_to_tensor=True)
-        audit_results = []
-
-        for i, rule in enumerate(self.rules):
-            scores = util.cos_sim(self.rule_embeddings[i], policy_embeddings)[0]
-            best_match_idx = scores.argmax().item()
-            score = scores[best_match_idx].item()
-            matched_text = policy_chunks[best_match_idx]
-            
-            is_compliant = score > threshold 
-            
-            audit_results.append({
-                'rule_id': rule['id'],
-                'requirement': rule['text'],
-                'match_score': round(score * 100, 1),
-                'status': 'PASS' if is_compliant else 'FAIL',
-                'company_clause': matched_text if is_compliant else "No matching clause found."
-            })
-            
-        return audit_results
+# Single definition lives in ai_ingine.py; the app only builds the UI around it
+from ai_ingine import ComplianceAuditor
 
 # ==========================================
 # 🎨 PART 2: THE APP UI (Frontend)
@@ -118,80 +65,112 @@ except Exception as e:
     st.error(f"❌ Critical Error: Could not load AI Engine. {e}")
     st.stop()
 
+# Streamlit reruns the whole script on every widget change; these caches make reruns
+# with the same document skip decoding, splitting and encoding it again.
+# max_entries bounds how many documents a long-running server keeps in memory.
+@st.cache_data(show_spinner=False, max_entries=8)
+def _read_upload(file_bytes):
+    return file_bytes.decode("utf-8")
+
+# Returns (chunks, embeddings as a numpy array); both only depend on the policy text, so
+# threshold changes reuse them. Entries expire after an hour as well as past max_entries.
+@st.cache_data(show_spinner=False, max_entries=8, ttl=3600)
+def _encode_policy(policy_text, _auditor):
+    return _auditor.encode_policy(policy_text)
+
+# Results are a small list of dicts, so repeat audits of the same text and threshold are free;
+# entries are keyed by (text, threshold); max_entries caps their total and the TTL drops stale ones
+@st.cache_data(ttl=24*60*60, show_spinner=False, max_entries=64)
+def run_audit(policy_content, threshold):
+    auditor = load_auditor()
+    policy_chunks, policy_embeddings = _encode_policy(policy_content, auditor)
+    return auditor.score_policy(policy_chunks, policy_embeddings, threshold=threshold)
+
 # Main Logic
 policy_content = ""
 if uploaded_file:
-    policy_content = uploaded_file.read().decode("utf-8")
+    policy_content = _read_upload(uploaded_file.getvalue())
 elif text_input:
     policy_content = text_input
 
 if st.button("🚀 Run Compliance Audit", type="primary", use_container_width=True):
     if not policy_content:
         st.warning("⚠️ Please upload a document or paste text to begin.")
+    st.session_state['audited_policy'] = policy_content
+
+# Once a policy has been audited, later reruns (e.g. moving the threshold slider)
+# only repeat the cheap scoring step against the cached embeddings.
+if policy_content and st.session_state.get('audited_policy') == policy_content:
+    with st.spinner("🤖 AI is analyzing legal clauses against 2025 Rules..."):
+        results = run_audit(policy_content, threshold)
+    
+    if not results:
+        st.error("❌ No results generated. Check if 'dpdp_rules.txt' is loaded correctly.")
     else:
-        with st.spinner("🤖 AI is analyzing legal clauses against 2025 Rules..."):
-            results = auditor.audit_policy(policy_content, threshold=threshold)
+        # Metrics
+        pass_count = sum(1 for r in results if r['status'] == 'PASS')
+        total_rules = len(results)
+        score = int((pass_count / total_rules) * 100) if total_rules > 0 else 0
+        
+        st.subheader("📊 Audit Dashboard")
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Compliance Score", f"{score}%")
+        m2.metric("Rules Analyzed", total_rules)
+        m3.metric("Passed Clauses", pass_count, delta="Safe")
+        m4.metric("Critical Gaps", total_rules - pass_count, delta="-High Risk", delta_color="inverse")
+        
+        st.divider()
+
+        # Visualization
+        c1, c2 = st.columns([1, 2])
+        with c1:
+            # Imported on first render so cold start shows the UI sooner; cached after that
+            import pandas as pd
+            import plotly.express as px
+            chart_data = pd.DataFrame({
+                "Status": ["Compliant", "Gaps"],
+                "Count": [pass_count, total_rules - pass_count]
+            })
+            # Use standard Plotly colors that work on dark/light backgrounds
+            fig = px.pie(chart_data, values='Count', names='Status', hole=0.5,
+                         color='Status', color_discrete_map={'Compliant':'#00CC96', 'Gaps':'#EF553B'})
+            fig.update_layout(showlegend=False, margin=dict(t=0, b=0, l=0, r=0), height=200)
+            st.plotly_chart(fig, use_container_width=True)
+        
+        with c2:
+            st.markdown("#### Risk Assessment")
+            if score > 80: st.success("This policy is largely compliant. Review minor gaps.")
+            elif score > 50: st.warning("Moderate Risk. Significant updates required for 2025 compliance.")
+            else: st.error("High Risk. Policy likely predates the 2025 Act.")
+        
+        # Detailed Report
+        st.subheader("📝 Detailed Findings")
+        tab1, tab2 = st.tabs(["🔴 Gaps & Violations", "✅ Compliant Clauses"])
+        
+        with tab1:
+            gaps = [r for r in results if r['status'] == 'FAIL']
+            if not gaps: st.info("No gaps detected! 🎉")
+            for res in gaps:
+                with st.expander(f"🔴 {res['rule_id']} (Confidence: {res['match_score']}%)"):
+                    st.markdown(f"**Missing Requirement:**")
+                    st.info(res['requirement']) # Using st.info for better visibility in dark mode
+                    st.markdown("**Recommendation:** *Add a specific clause addressing this requirement.*")
+
+        with tab2:
+            passes = [r for r in results if r['status'] == 'PASS']
+            if not passes: st.info("No compliant clauses found.")
+            for res in passes:
+                with st.expander(f"✅ {res['rule_id']} (Confidence: {res['match_score']}%)"):
+                    st.markdown(f"**Requirement:**")
+                    st.text(res['requirement'])
+                    st.success(f"**Found in Policy:**\n> \"{res['company_clause']}\"")
         
-        if not results:
-            st.error("❌ No results generated. Check if 'dpdp_rules.txt' is loaded correctly.")
-        else:
-            # Metrics
-            pass_count = sum(1 for r in results if r['status'] == 'PASS')
-            total_rules = len(results)
-            score = int((pass_count / total_rules) * 100) if total_rules > 0 else 0
-            
-            st.subheader("📊 Audit Dashboard")
-            m1, m2, m3, m4 = st.columns(4)
-            m1.metric("Compliance Score", f"{score}%")
-            m2.metric("Rules Analyzed", total_rules)
-            m3.metric("Passed Clauses", pass_count, delta="Safe")
-            m4.metric("Critical Gaps", total_rules - pass_count, delta="-High Risk", delta_color="inverse")
-            
-            st.divider()
-
-            # Visualization
-            c1, c2 = st.columns([1, 2])
-            with c1:
-                chart_data = pd.DataFrame({
-                    "Status": ["Compliant", "Gaps"],
-                    "Count": [pass_count, total_rules - pass_count]
-                })
-                # Use standard Plotly colors that work on dark/light backgrounds
-                fig = px.pie(chart_data, values='Count', names='Status', hole=0.5,
-                             color='Status', color_discrete_map={'Compliant':'#00CC96', 'Gaps':'#EF553B'})
-                fig.update_layout(showlegend=False, margin=dict(t=0, b=0, l=0, r=0), height=200)
-                st.plotly_chart(fig, use_container_width=True)
-            
-            with c2:
-                st.markdown("#### Risk Assessment")
-                if score > 80: st.success("This policy is largely compliant. Review minor gaps.")
-                elif score > 50: st.warning("Moderate Risk. Significant updates required for 2025 compliance.")
-                else: st.error("High Risk. Policy likely predates the 2025 Act.")
-            
-            # Detailed Report
-            st.subheader("📝 Detailed Findings")
-            tab1, tab2 = st.tabs(["🔴 Gaps & Violations", "✅ Compliant Clauses"])
-            
-            with tab1:
-                gaps = [r for r in results if r['status'] == 'FAIL']
-                if not gaps: st.info("No gaps detected! 🎉")
-                for res in gaps:
-                    with st.expander(f"🔴 {res['rule_id']} (Confidence: {res['match_score']}%)"):
-                        st.markdown(f"**Missing Requirement:**")
-                        st.info(res['requirement']) # Using st.info for better visibility in dark mode
-                        st.markdown("**Recommendation:** *Add a specific clause addressing this requirement.*")
-
-            with tab2:
-                passes = [r for r in results if r['status'] == 'PASS']
-                if not passes: st.info("No compliant clauses found.")
-                for res in passes:
-                    with st.expander(f"✅ {res['rule_id']} (Confidence: {res['match_score']}%)"):
-                        st.markdown(f"**Requirement:**")
-                        st.text(res['requirement'])
-                        st.success(f"**Found in Policy:**\n> \"{res['company_clause']}\"")
-            
-            # Download
-            st.divider()
-            df = pd.DataFrame(results)
-            csv = df.to_csv(index=False).encode('utf-8')
-            st.download_button("📥 Download Full Audit Report (CSV)", csv, 'dpdp_audit_report.csv', 'text/csv')
+        # Download
+        st.divider()
+        # Write the rows straight out; a DataFrame would copy every field just to serialize it
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+        report_csv = buf.getvalue().encode('utf-8')
+        st.download_button("📥 Download Full Audit Report (CSV)", report_csv, 'dpdp_audit_report.csv', 'text/csv')
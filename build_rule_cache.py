@@ -0,0 +1,25 @@
+import os
+import sys
+from ai_ingine import ComplianceAuditor
+
+# Run once at build/deploy time so the app's first start memory-maps the rule
+# embeddings instead of running the encoder.
+# Usage: python build_rule_cache.py [--quantized]
+print("--- 🧮 RULE EMBEDDING CACHE BUILDER ---")
+
+quantized = '--quantized' in sys.argv
+
+# 1. Constructing the auditor encodes the rules and writes the cache on a miss
+auditor = ComplianceAuditor(quantized=quantized)
+
+if not auditor.rules:
+    print("❌ No rules found. Check that 'dpdp_rules.txt' is in the current directory.")
+    sys.exit(1)
+
+# 2. Report where the cache landed
+path = auditor.rule_cache_path()
+if os.path.exists(path):
+    print(f"✅ {len(auditor.rules)} rule embeddings cached at {path}")
+else:
+    print(f"❌ Could not write {path}. Is the 'cache' directory writable?")
+    sys.exit(1)